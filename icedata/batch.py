@@ -0,0 +1,186 @@
+"""Batch extraction of datasets to netCDF files
+
+The job file is a JSON list of jobs, for instance:
+
+    [
+        {"dataset": "greenland.bamber2013", "variables": ["surface_elevation"],
+         "bbox": [-500e3, 0, -1500e3, -800e3], "maxshape": [400, 400],
+         "output": "bamber_zs.nc"},
+        {"dataset": "greenland.morlighem2014", "variables": "bedrock_elevation",
+         "output": "morlighem_zb.nc"}
+    ]
+
+Only "dataset" and "output" are required. Any additional "options" (dict)
+are passed on to the dataset's load function. Compact grids (option
+"compact") are written as full grids.
+"""
+from __future__ import print_function, division
+import json
+import time
+import traceback
+from collections import OrderedDict
+from importlib import import_module
+from multiprocessing import Pool, cpu_count
+import dimarray as da
+from . import settings
+from .common import keep_open
+from .compact import CompactGrid, CompactDataset
+
+def read_jobs(jobfile):
+    """Read the list of jobs from a JSON file
+    """
+    with open(jobfile) as f:
+        jobs = json.load(f)
+    for i, job in enumerate(jobs):
+        for key in ['dataset', 'output']:
+            if key not in job:
+                raise ValueError("job {}: missing {!r}".format(i, key))
+        job.setdefault('id', i)
+    return jobs
+
+def get_dataset(name):
+    """Import a dataset module, e.g. 'greenland.bamber2013'
+    """
+    return import_module('icedata.'+name)
+
+def source_file(job):
+    """netCDF file read by a job, used to group jobs
+    """
+    try:
+        mod = get_dataset(job['dataset'])
+    except ImportError:
+        return job['dataset']  # the job will fail in run_job
+    if hasattr(mod, 'NCFILE'):
+        return mod.NCFILE
+    if hasattr(mod, 'get_file'):
+        return mod.get_file()
+    return job['dataset']
+
+def _nbytes(data):
+    if isinstance(data, da.Dataset):
+        return sum(data[k].values.nbytes for k in data.keys())
+    return data.values.nbytes
+
+def run_job(job):
+    """Load the data for one job and write it to netCDF
+
+    Returns
+    -------
+    dict with job id, status ("ok" or "failed"), elapsed time,
+    number of bytes loaded and error message, if any
+    """
+    start = time.time()
+    result = {'id': job['id'], 'output': job['output'], 'nbytes': 0, 'error': None}
+    try:
+        mod = get_dataset(job['dataset'])
+        maxshape = job.get('maxshape')
+        data = mod.load(job.get('variables'), bbox=job.get('bbox'),
+                        maxshape=tuple(maxshape) if maxshape is not None else None,
+                        **job.get('options', {}))
+        # compact grids are written to netCDF as full grids
+        if isinstance(data, CompactDataset):
+            data = data.to_dataset()
+        elif isinstance(data, CompactGrid):
+            data = data.to_dimarray()
+        if isinstance(data, da.Dataset):
+            data.write_nc(job['output'], mode='w')
+        else:
+            data.write_nc(job['output'], name=job['variables'], mode='w')
+        result['nbytes'] = _nbytes(data)
+        result['status'] = 'ok'
+    except Exception:
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    result['elapsed'] = time.time() - start
+    return result
+
+# netCDF handles kept open for the life of a worker process
+_worker_context = None
+
+def _init_worker(dataroot):
+    global _worker_context
+    settings.DATAROOT = dataroot
+    _worker_context = keep_open()
+    _worker_context.__enter__()
+
+def run_jobs(jobs):
+    """Run a list of jobs in one worker
+    """
+    return [run_job(job) for job in jobs]
+
+def chunk_jobs(jobs, processes):
+    """Split jobs into chunks of the same source file, for the workers
+
+    Jobs reading the same file are split into at most `processes` chunks,
+    so that each chunk reuses the same netCDF handle, while the workers
+    still share the jobs on a single file.
+    """
+    groups = OrderedDict()
+    for job in jobs:
+        groups.setdefault(str(source_file(job)), []).append(job)
+    chunks = []
+    for group in groups.values():
+        size = -(-len(group) // processes)
+        chunks.extend(group[i:i+size] for i in range(0, len(group), size))
+    return chunks
+
+def _print_result(r):
+    mb = r['nbytes'] / 1e6
+    print("[{status}] job {id}: {output} - {mb:.1f} MB in {elapsed:.2f} s ({rate:.1f} MB/s)".format(
+        mb=mb, rate=mb/r['elapsed'] if r['elapsed'] > 0 else 0, **r))
+    if r['error']:
+        print(r['error'])
+
+def run_batch(jobs, processes=None, retries=1, verbose=True, dataroot=None):
+    """Run jobs on a process pool, in chunks of the same source file (see chunk_jobs)
+
+    Each worker keeps the netCDF files it opened until the end of the batch.
+
+    Parameters
+    ----------
+    jobs : list of job dicts (see read_jobs)
+    processes : int, optional
+        number of worker processes (default to number of CPUs)
+    retries : int, optional
+        number of times failed jobs are run again
+    verbose : bool, optional
+        print per-job and aggregate throughput
+    dataroot : str, optional
+        root directory of the datasets (default to settings.DATAROOT)
+
+    Returns
+    -------
+    results : list of result dict (see run_job), last attempt for each job
+    """
+    start = time.time()
+    results = OrderedDict()
+    todo = jobs
+    if dataroot is None:
+        dataroot = settings.DATAROOT
+    if processes is None:
+        processes = cpu_count()
+    pool = Pool(processes, initializer=_init_worker, initargs=(dataroot,))
+    try:
+        for attempt in range(retries+1):
+            if not todo:
+                break
+            if attempt > 0 and verbose:
+                print("retry {} failed job(s), attempt {}/{}".format(len(todo), attempt, retries))
+            for chunk in pool.imap_unordered(run_jobs, chunk_jobs(todo, processes)):
+                for r in chunk:
+                    results[r['id']] = r
+                    if verbose:
+                        _print_result(r)
+            todo = [job for job in todo if results[job['id']]['status'] != 'ok']
+    finally:
+        pool.close()
+        pool.join()
+
+    if verbose:
+        elapsed = time.time() - start
+        mb = sum(r['nbytes'] for r in results.values()) / 1e6
+        failed = sum(r['status'] != 'ok' for r in results.values())
+        print("{} job(s), {} failed: {:.1f} MB in {:.2f} s ({:.1f} MB/s)".format(
+            len(results), failed, mb, elapsed, mb/elapsed if elapsed > 0 else 0))
+
+    return list(results.values())
@@ -0,0 +1,53 @@
+"""Command-line interface: icedata <command> ...
+"""
+from __future__ import print_function
+import argparse
+import signal
+import sys
+from . import settings
+
+def batch(args):
+    from .batch import read_jobs, run_batch
+    jobs = read_jobs(args.jobfile)
+    results = run_batch(jobs, processes=args.processes, retries=args.retries, dataroot=args.dataroot)
+    return int(any(r['status'] != 'ok' for r in results))
+
+def serve(args):
+    from .server import Server
+    server = Server(args.socket, budget=args.memory*1e6 if args.memory else None, shm_dir=args.shm_dir)
+    print("icedata server listening on", server.socket_path)
+    # also clean up shared memory when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        print(server.stats())
+        server.server_close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='icedata', description=__doc__)
+    parser.add_argument('--dataroot', help='root directory of the datasets (default: %(default)s)', default=settings.DATAROOT)
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    p = subparsers.add_parser('batch', help='extract datasets to netCDF files, as listed in a JSON job file (see icedata.batch)')
+    p.add_argument('jobfile')
+    p.add_argument('-j', '--processes', type=int, help='number of worker processes (default: number of CPUs)')
+    p.add_argument('--retries', type=int, default=1, help='number of times failed jobs are run again (default: %(default)s)')
+    p.set_defaults(func=batch)
+
+    p = subparsers.add_parser('serve', help='load variables once in shared memory for local processes (see icedata.server)')
+    p.add_argument('--socket', default=settings.SERVER_SOCKET, help='Unix socket path (default: %(default)s)')
+    p.add_argument('--memory', type=float, help='memory budget in MB, least recently used variables are evicted beyond (default: no limit)')
+    p.add_argument('--shm-dir', help='directory for shared memory files (default: /dev/shm)')
+    p.set_defaults(func=serve)
+
+    args = parser.parse_args(argv)
+    settings.DATAROOT = args.dataroot
+    return args.func(args)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,16 @@
 from __future__ import division
 from os import path
+from contextlib import contextmanager
 import numpy as np
 import netCDF4 as nc
 import dimarray as da
 from . import settings
+from .compact import to_compact
+
+try:
+    basestring
+except NameError:  # python 3
+    basestring = str
 
 def transform_bbox(bbox, grid_mapping1, grid_mapping2):
     # get CARTOPY classes from C.F.1-6 convention
@@ -22,6 +29,255 @@ def transform_bbox(bbox, grid_mapping1, grid_mapping2):
     t2 = np.max(y2)
     return l2, r2, b2, t2
 
+def transform_polygon(polygon, grid_mapping1, grid_mapping2):
+    """Transform polygon vertices [(x0, y0), (x1, y1), ...] between coordinate systems
+    """
+    from dimarray.geo.crs import get_crs
+    crs1 = get_crs(grid_mapping1)
+    crs2 = get_crs(grid_mapping2)
+    px, py = np.asarray(polygon, dtype=float).T
+    xyz = crs2.transform_points(crs1, px, py)
+    return list(zip(xyz[...,0], xyz[...,1]))
+
+def polygon_bbox(polygon):
+    """Return the bounding box (left, right, bottom, top) of a polygon
+    """
+    px, py = np.asarray(polygon, dtype=float).T
+    return px.min(), px.max(), py.min(), py.max()
+
+def check_polygon(polygon, polygon_mapping=None, grid_mapping=None, sparse=False, compact=False):
+    """Check polygon-related options, return the polygon in the grid's coordinate system
+    """
+    if sparse and compact:
+        raise ValueError("sparse and compact are mutually exclusive")
+    if polygon is not None and polygon_mapping is not None:
+        polygon = transform_polygon(polygon, polygon_mapping, grid_mapping)
+    return polygon
+
+def polygon_runs(polygon, x, y):
+    """Rasterize a polygon onto a grid, as contiguous column runs for each row.
+
+    A grid cell is selected if its center is inside the polygon (even-odd rule).
+
+    Parameters
+    ----------
+    polygon : list of [(x0,y0), (x1, y1), ...] vertices (closed implicitly)
+    x : array-like, increasing x-coordinate of the grid
+    y : array-like, y-coordinate of the grid (increasing or decreasing)
+
+    Returns
+    -------
+    rows, starts, stops : integer arrays, sorted by row then start
+        so that cells y[row], x[start:stop] are inside the polygon
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    px, py = np.asarray(polygon, dtype=float).T
+    x0, y0 = px, py
+    x1, y1 = np.roll(px, -1), np.roll(py, -1)
+
+    # work on increasing y
+    flipped = y.size > 1 and y[0] > y[-1]
+    if flipped:
+        y = y[::-1]
+
+    # rows crossed by each edge, with half-open rule ylo <= y < yhi,
+    # so that every row has an even number of crossings
+    ilo = np.searchsorted(y, np.minimum(y0, y1), side='left')
+    ihi = np.searchsorted(y, np.maximum(y0, y1), side='left')
+    n = ihi - ilo
+    edges = np.repeat(np.arange(n.size), n)
+    rows = np.repeat(ilo, n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+
+    # x-coordinate of the crossings, paired within each row
+    t = (y[rows] - y0[edges]) / (y1[edges] - y0[edges])
+    xc = x0[edges] + t * (x1[edges] - x0[edges])
+    order = np.lexsort((xc, rows))
+    rows = rows[order][::2]
+    xc = xc[order]
+    starts = np.searchsorted(x, xc[::2], side='left')
+    stops = np.searchsorted(x, xc[1::2], side='left')
+
+    valid = stops > starts
+    rows, starts, stops = rows[valid], starts[valid], stops[valid]
+    if flipped:
+        rows = y.size - 1 - rows
+        order = np.lexsort((starts, rows))
+        rows, starts, stops = rows[order], starts[order], stops[order]
+    return rows, starts, stops
+
+def run_cells(rows, starts, stops):
+    """Row and column indices of all cells in the runs, in row-major order
+    """
+    lengths = np.asarray(stops) - np.asarray(starts)
+    offsets = np.cumsum(lengths) - lengths
+    cols = np.repeat(np.asarray(starts) - offsets, lengths) + np.arange(lengths.sum())
+    return np.repeat(rows, lengths), cols
+
+def group_runs(rows, starts, stops, fill_ratio=0.5, overhead=4096):
+    """Group row runs into rectangular blocks to be read in one go.
+
+    The bounding rectangle of the runs is recursively split along its longest
+    side until the cells to keep make up at least `fill_ratio` of each block,
+    or until the block is too small to be worth another read.
+
+    Parameters
+    ----------
+    rows, starts, stops : runs as returned by polygon_runs
+    fill_ratio : float, optional
+        minimum fraction of useful cells in a block
+    overhead : int, optional
+        cost of one read, expressed in number of cells
+
+    Returns
+    -------
+    list of ((r0, r1, c0, c1), (rows, starts, stops, offsets)) :
+        block boundaries (stop excluded) and the runs it contains, where
+        offsets indicate the position of each run in the packed cell values
+        (row-major order of the full rasterized polygon)
+    """
+    rows, starts, stops = np.asarray(rows), np.asarray(starts), np.asarray(stops)
+    offsets = np.cumsum(stops - starts) - (stops - starts)
+    blocks = []
+    todo = [(rows, starts, stops, offsets)]
+    while todo:
+        runs = todo.pop()
+        rows, starts, stops, offsets = runs
+        if rows.size == 0:
+            continue
+        r0, r1 = rows.min(), rows.max() + 1
+        c0, c1 = starts.min(), stops.max()
+        area = (r1 - r0) * (c1 - c0)
+        if area <= overhead or (stops - starts).sum() >= fill_ratio * area:
+            blocks.append(((r0, r1, c0, c1), runs))
+        elif r1 - r0 >= c1 - c0:
+            mid = (r0 + r1) // 2
+            before = rows < mid
+            todo.append(tuple(a[~before] for a in runs))
+            todo.append(tuple(a[before] for a in runs))
+        else:
+            mid = (c0 + c1) // 2
+            for lo, hi in [(mid, c1), (c0, mid)]:
+                start = np.maximum(starts, lo)
+                stop = np.minimum(stops, hi)
+                keep = stop > start
+                todo.append((rows[keep], start[keep], stop[keep], (offsets + start - starts)[keep]))
+    return blocks
+
+def _sub_slice(s, n, i0, i1):
+    """Indexing slice for positions [i0, i1) of slice s on an axis of size n
+    """
+    start, _, step = s.indices(n)
+    stop = start + i1*step
+    if stop < 0:
+        stop = None
+    return slice(start + i0*step, stop, step)
+
+def read_runs(ncvar, blocks, slice_y, slice_x, ydim, xdim, indices=None, packed=False):
+    """Read polygon runs from a netCDF variable
+
+    Parameters
+    ----------
+    ncvar : netCDF4.Variable
+    blocks : grouped runs, as returned by group_runs, in position of the
+        sub-sampled grid defined by slice_y, slice_x
+    slice_y, slice_x : slices of the grid on which the polygon was rasterized
+    ydim, xdim : names of y and x dimensions in the file
+    indices : dict of integer indices for other dimensions (e.g. time)
+    packed : bool, optional
+        if True, return the values inside the polygon as a 1-D array along the
+        last dimension, in row-major order. Otherwise return the full array
+        on the sub-sampled grid, filled with NaN outside the polygon.
+
+    Returns
+    -------
+    values : numpy array with y, x as last dimensions (or cells if packed)
+    dims : dimension names of values, without y and x
+    """
+    if indices is None:
+        indices = {}
+    dims = [d for d in ncvar.dimensions if d not in indices]
+    ypos = dims.index(ydim)
+    xpos = dims.index(xdim)
+    other_dims = [d for d in dims if d not in (ydim, xdim)]
+    other_shape = tuple(ncvar.shape[ncvar.dimensions.index(d)] for d in other_dims)
+    ny = ncvar.shape[ncvar.dimensions.index(ydim)]
+    nx = ncvar.shape[ncvar.dimensions.index(xdim)]
+
+    if packed:
+        shape = (sum((runs[2] - runs[1]).sum() for _, runs in blocks),)
+    else:
+        shape = (len(range(*slice_y.indices(ny))), len(range(*slice_x.indices(nx))))
+
+    values = None
+    for (r0, r1, c0, c1), (rows, starts, stops, offsets) in blocks:
+        idx = [indices.get(d, slice(None)) for d in ncvar.dimensions]
+        idx[ncvar.dimensions.index(ydim)], flip = forward_slice(_sub_slice(slice_y, ny, r0, r1), ny)
+        idx[ncvar.dimensions.index(xdim)] = _sub_slice(slice_x, nx, c0, c1)
+        block = np.ma.asarray(ncvar[tuple(idx)])
+        if values is None:
+            # same type as netCDF4 returns (e.g. unpacked with scale_factor)
+            values = np.empty(other_shape + shape, dtype=np.promote_types(block.dtype, np.float32))
+            values.fill(np.nan)
+        block = np.ma.filled(block.astype(values.dtype), np.nan)
+        block = np.moveaxis(block, [ypos, xpos], [-2, -1])
+        if flip:
+            block = block[..., ::-1, :]
+        for row, start, stop, offset in zip(rows, starts, stops, offsets):
+            run = block[..., row-r0, start-c0:stop-c0]
+            if packed:
+                values[..., offset:offset+stop-start] = run
+            else:
+                values[..., row, start:stop] = run
+
+    if values is None:  # empty polygon
+        values = np.empty(other_shape + shape, dtype=np.promote_types(ncvar.dtype, np.float32))
+        values.fill(np.nan)
+    return values, other_dims
+
+def read_polygon(nc_ds, ncvariables, x, y, slice_x, slice_y, polygon, ydim='y', xdim='x', indices=None, sparse=False):
+    """Read netCDF variables inside a polygon into a dimarray.Dataset
+
+    Parameters
+    ----------
+    nc_ds : netCDF4.Dataset
+    ncvariables : list of variable names in the file
+    x, y : coordinates of the full grid (array-like or netCDF variables)
+    slice_x, slice_y : indexing slices (bounding box and sub-sampling)
+    polygon : list of [(x0,y0), (x1, y1), ...] vertices, in the grid's coordinate system
+    ydim, xdim : names of y and x dimensions in the file
+    indices : dict of integer indices for other dimensions (e.g. time)
+    sparse : bool, optional
+        if True, only return the cells inside the polygon, along a "cell"
+        dimension (position in the flattened bounding box), with x and y
+        as additional variables. Otherwise return the bounding box grid,
+        filled with NaN outside the polygon.
+    """
+    xs = np.asarray(x[slice_x])
+    ys = np.asarray(y[slice_y])
+    rows, starts, stops = polygon_runs(polygon, xs, ys)
+    blocks = group_runs(rows, starts, stops)
+
+    data = da.Dataset()
+    if sparse:
+        rows, cols = run_cells(rows, starts, stops)
+        cells = rows*xs.size + cols
+        data['x'] = da.DimArray(xs[cols], axes=[cells], dims=['cell'])
+        data['y'] = da.DimArray(ys[rows], axes=[cells], dims=['cell'])
+
+    for nm in ncvariables:
+        ncvar = nc_ds.variables[nm]
+        values, dims = read_runs(ncvar, blocks, slice_y, slice_x, ydim, xdim, indices=indices, packed=sparse)
+        axes = [nc_ds.variables[d][:] if d in nc_ds.variables else np.arange(n) for d, n in zip(dims, values.shape)]
+        if sparse:
+            data[nm] = da.DimArray(values, axes=axes+[cells], dims=dims+['cell'])
+        else:
+            data[nm] = da.DimArray(values, axes=axes+[ys, xs], dims=dims+[ydim, xdim])
+        data[nm].attrs.update({att:ncvar.getncattr(att) for att in ncvar.ncattrs()})
+
+    data.attrs.update({att:nc_ds.getncattr(att) for att in nc_ds.ncattrs()})
+    return data
+
 def get_slices_xy(xy, bbox, maxshape, inverted_y_axis):
     """Return indexing slices along x and y.
 
@@ -50,16 +306,96 @@ def get_slices_xy(xy, bbox, maxshape, inverted_y_axis):
     slice_x = slice(startx, stopx, stepx)
     # invert sampling ?
     if inverted_y_axis:
-        slice_y = slice(y.size-starty, y.size-stopy, -stepy)
+        stopy = y.size-1-stopy
+        slice_y = slice(y.size-1-starty, stopy if stopy >= 0 else None, -stepy)
     else:
         slice_y = slice(starty, stopy, stepy)
     return slice_x, slice_y
 
+def forward_slice(s, n):
+    """Forward equivalent of a slice along an axis of size n
+
+    Negative-step slices (inverted y axis) are much slower to read from
+    netCDF files than forward slices: read forward, then flip in memory
+    (e.g. `values[::-1]`, a view).
+
+    Returns
+    -------
+    slice with positive step, selecting the same elements
+    flip : bool, True if the result must be reversed
+    """
+    start, stop, step = s.indices(n)
+    if step > 0:
+        return slice(start, stop, step), False
+    size = len(range(start, stop, step))
+    if size == 0:
+        return slice(0, 0, 1), False
+    return slice(start + (size-1)*step, start+1, -step), True
+
+def flip_dataset(data, dim):
+    """Reverse a dimarray.Dataset along a dimension, with views on the original data
+    """
+    flipped = da.Dataset()
+    for k in data.keys():
+        a = data[k]
+        if dim in a.dims:
+            idx = [slice(None)]*a.ndim
+            idx[a.dims.index(dim)] = slice(None, None, -1)
+            axes = [ax.values[::-1] if ax.name == dim else ax.values for ax in a.axes]
+            b = da.DimArray(a.values[tuple(idx)], axes=axes, dims=a.dims)
+            b.attrs.update(a.attrs)
+            for ax_b, ax in zip(b.axes, a.axes):
+                ax_b.attrs.update(ax.attrs)  # coordinate metadata
+            a = b
+        flipped[k] = a
+    flipped.attrs.update(data.attrs)
+    return flipped
+
 def get_datafile(ncfile, dataroot=None):
     if dataroot is None:
         dataroot = settings.DATAROOT
     return path.join(dataroot, ncfile)
 
+# netCDF handles kept open by keep_open(), by file name
+_OPEN_DATASETS = None
+
+@contextmanager
+def keep_open():
+    """Reuse netCDF file handles across load calls within this context
+
+    Examples
+    --------
+    >>> with keep_open():
+    ...     zs = bamber2013.load('surface_elevation', bbox=bbox1)
+    ...     zb = bamber2013.load('bedrock_elevation', bbox=bbox2)
+    """
+    global _OPEN_DATASETS
+    if _OPEN_DATASETS is not None:
+        yield  # nested context: let the outer one close the files
+        return
+    _OPEN_DATASETS = {}
+    try:
+        yield
+    finally:
+        for nc_ds in _OPEN_DATASETS.values():
+            nc_ds.close()
+        _OPEN_DATASETS = None
+
+def open_dataset(ncfile):
+    """Open a netCDF dataset for reading (reused within keep_open)
+    """
+    if _OPEN_DATASETS is None:
+        return nc.Dataset(ncfile)
+    if ncfile not in _OPEN_DATASETS:
+        _OPEN_DATASETS[ncfile] = nc.Dataset(ncfile)
+    return _OPEN_DATASETS[ncfile]
+
+def close_dataset(nc_ds):
+    """Close a dataset opened with open_dataset (unless kept open)
+    """
+    if _OPEN_DATASETS is None:
+        nc_ds.close()
+
 def check_variables(variables):
     if isinstance(variables, basestring):
         variable = variables
@@ -68,7 +404,7 @@ def check_variables(variables):
         variable = None
     return variables, variable
 
-def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None, map_dim_names=None, time_idx=None, time_dim='time', inverted_y_axis=False, dataroot=None, x=None, y=None, xdim='x', ydim='y'):
+def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None, map_dim_names=None, time_idx=None, time_dim='time', inverted_y_axis=False, dataroot=None, x=None, y=None, xdim='x', ydim='y', polygon=None, polygon_mapping=None, grid_mapping=None, sparse=False, compact=False):
     """Standard ncload for netCDF files
 
     Parameters
@@ -76,10 +412,19 @@ def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None,
     map_var_name : None or dict-like : make standard variables and actual file variables names match
     map_dim_name : None or dict-like : make standard dimensions and actual file dimensions names match
     inverted_y_axis : deal with the case where y axis is inverted (Rignot and Mouginot, Morlighem...)
+        if "auto", determined from the y coordinate. Data are read forward and flipped in memory.
     time_idx, time_dim : can be provided to extract a time slice
     dataroot : provide an alternative root path for datasets
     x, y : array-like : provide coordinates directly, when not present in file.
+    polygon : list of [(x0,y0), (x1, y1), ...] vertices : only read the grid cells inside
+        the polygon (e.g. a glacier outline, see read_polygon), within bbox if provided.
+    polygon_mapping, grid_mapping : dict : grid mappings of the polygon coordinates and
+        of the file, if the polygon needs to be transformed
+    sparse : bool : with polygon, only return the cells inside, along a "cell" dimension
+        (see read_polygon), always as a Dataset, with x and y as variables
+    compact : bool : return the valid cells only, as CompactGrid (see icedata.compact)
     """
+    polygon = check_polygon(polygon, polygon_mapping, grid_mapping, sparse=sparse, compact=compact)
     ncfile = get_datafile(ncfile, dataroot)
     variables, _variable = check_variables(variables)
 
@@ -98,7 +443,7 @@ def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None,
         ynm = ydim
 
     # open the netCDF dataset
-    nc_ds = nc.Dataset(ncfile)
+    nc_ds = open_dataset(ncfile)
 
     external_axes = x is not None or y is not None
     if x is None:
@@ -106,20 +451,35 @@ def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None,
     if y is None:
         y = nc_ds.variables[ynm]
 
+    if inverted_y_axis == 'auto':
+        inverted_y_axis = bool(np.size(y) > 1 and y[0] > y[-1])
+
+    # only read the polygon's bounding box
+    if polygon is not None and bbox is None:
+        bbox = polygon_bbox(polygon)
+
     # determine the indices to extract
     slice_x, slice_y = get_slices_xy(xy=(x, y), bbox=bbox, maxshape=maxshape, inverted_y_axis=inverted_y_axis)
-    indices = {xnm:slice_x,ynm:slice_y}
+    forward_y, flip = forward_slice(slice_y, np.size(y))
+    indices = {xnm:slice_x,ynm:forward_y}
     if time_idx is not None:
         indices[time_dim] = time_idx
 
-    # load the data using dimarray (which also copy attributes etc...)
-    data = da.read_nc(nc_ds, ncvariables, indices=indices, indexing='position')
+    if polygon is not None:
+        # read only the cells inside the polygon
+        data = read_polygon(nc_ds, ncvariables, x, y, slice_x, slice_y, polygon, ydim=ynm, xdim=xnm,
+                            indices={time_dim:time_idx} if time_idx is not None else None, sparse=sparse)
+    else:
+        # load the data using dimarray (which also copy attributes etc...)
+        data = da.read_nc(nc_ds, ncvariables, indices=indices, indexing='position')
+        if flip:
+            data = flip_dataset(data, ynm)
 
     # close dataset
-    nc_ds.close()
+    close_dataset(nc_ds)
 
     # in case axes were provided externally, just replace the values
-    if external_axes:
+    if external_axes and polygon is None:
         data.axes[xnm][:] = x[slice_x]
         data.axes[ynm][:] = y[slice_y]
 
@@ -135,8 +495,12 @@ def ncload(ncfile, variables=None, bbox=None, maxshape=None, map_var_names=None,
     if map_var_names is not None:
         data.rename_keys({ncvar:var for var, ncvar in zip(variables, ncvariables)}, inplace=True)
 
-    # only one variable
-    if _variable is not None:
+    # only store valid cells
+    if compact:
+        data = to_compact(data)
+
+    # only one variable (sparse cells keep their x and y coordinates)
+    if _variable is not None and not (sparse and polygon is not None):
         data = data[_variable]
 
     return data
@@ -0,0 +1,327 @@
+"""Compact representation of mostly-masked 2-D grids
+
+Only the valid cells are stored, as runs of contiguous columns along each
+row (row spans) and a packed 1-D array of values.
+"""
+from __future__ import division
+import json
+import struct
+from collections import OrderedDict
+import numpy as np
+import dimarray as da
+
+_MAGIC = b'ICDCMP01'
+_ALIGN = 64
+
+def _runs_from_mask(mask):
+    """Row spans (rows, starts, stops) of True values in a 2-D boolean array
+    """
+    padded = np.zeros((mask.shape[0], mask.shape[1]+2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    diff = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(diff == 1)
+    _, stops = np.nonzero(diff == -1)
+    return rows, starts, stops
+
+def _runs_from_cells(cells, nx):
+    """Row spans (rows, starts, stops) from sorted, flat cell indices
+    """
+    cells = np.asarray(cells)
+    if cells.size == 0:
+        empty = np.zeros(0, dtype=int)
+        return empty, empty, empty
+    new = np.ones(cells.size, dtype=bool)
+    new[1:] = (np.diff(cells) != 1) | (cells[1:] % nx == 0)
+    first = np.flatnonzero(new)
+    last = np.append(first[1:], cells.size) - 1
+    rows, starts = np.divmod(cells[first], nx)
+    stops = cells[last] % nx + 1
+    return rows, starts, stops
+
+def _nearest(coord, values):
+    """Index of the nearest grid point, -1 if outside the grid
+    """
+    coord = np.asarray(coord)
+    values = np.asarray(values, dtype=float)
+    n = coord.size
+    flipped = n > 1 and coord[0] > coord[-1]
+    if flipped:
+        coord = coord[::-1]
+    if n > 1:
+        i = np.clip(np.searchsorted(coord, values), 1, n-1)
+        i = np.where(values - coord[i-1] <= coord[i] - values, i-1, i)
+        half = 0.5*(coord[1] - coord[0])
+    else:
+        i = np.zeros(values.shape, dtype=int)
+        half = 0.
+    if flipped:
+        i = n - 1 - i
+    i[(values < coord[0] - half) | (values > coord[-1] + half) | np.isnan(values)] = -1
+    return i
+
+
+class CompactGrid(np.lib.mixins.NDArrayOperatorsMixin):
+    """Valid cells of a 2-D grid, stored as row spans and packed values
+
+    Parameters
+    ----------
+    values : 1-D array of valid values, in row-major order
+    rows, starts, stops : integer arrays of the same size, sorted by row and start,
+        so that values for cells [row, start:stop] are contiguous in `values`
+    x, y : coordinates of the full grid
+    dims : dimension names along y and x
+    attrs : dict of metadata
+
+    Examples
+    --------
+    >>> from icedata.greenland import rignot_mouginot2012 as rm
+    >>> v = rm.load('surface_velocity', compact=True)
+    >>> v.lookup([-200e3, -150e3], [-2200e3, -2250e3])
+    >>> v.save('velocity.cmp')
+    >>> v = CompactGrid.load('velocity.cmp')  # memory-mapped
+    >>> v.to_dimarray()
+    """
+    _fields = ['values', 'rows', 'starts', 'stops', 'x', 'y', 'dims', 'attrs', 'offsets']
+
+    def __init__(self, values, rows, starts, stops, x, y, dims=('y','x'), attrs=None):
+        self.values = values
+        self.rows = np.asarray(rows)
+        self.starts = np.asarray(starts)
+        self.stops = np.asarray(stops)
+        self.x = np.asarray(x)
+        self.y = np.asarray(y)
+        self.dims = tuple(dims)
+        self.attrs = OrderedDict(attrs or {})
+        lengths = self.stops - self.starts
+        self.offsets = np.cumsum(lengths) - lengths
+
+    # metadata as attributes, just like dimarray.DimArray
+    def __getattr__(self, name):
+        if name.startswith('_') or name in self._fields:
+            raise AttributeError(name)
+        try:
+            return self.attrs[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name.startswith('_') or name in self._fields:
+            object.__setattr__(self, name, value)
+        else:
+            self.attrs[name] = value
+
+    @property
+    def shape(self):
+        return (self.y.size, self.x.size)
+
+    @property
+    def size(self):
+        return self.values.size
+
+    @property
+    def dtype(self):
+        return self.values.dtype
+
+    def __repr__(self):
+        return "CompactGrid: {} valid cells out of {} ({} row spans)\n{} / {}\n{} / {}".format(
+            self.size, self.shape[0]*self.shape[1], self.rows.size,
+            self.dims[0], self.y.size, self.dims[1], self.x.size)
+
+    @classmethod
+    def from_dense(cls, values, x, y, dims=('y','x'), attrs=None):
+        """Create from a dense 2-D array, where masked and NaN values are invalid
+        """
+        values = np.ma.asarray(values)
+        mask = ~np.ma.getmaskarray(values)
+        if values.dtype.kind in 'fc':
+            mask &= np.isfinite(values.data)
+        rows, starts, stops = _runs_from_mask(mask)
+        return cls(values.data[mask], rows, starts, stops, x, y, dims=dims, attrs=attrs)
+
+    @classmethod
+    def from_dimarray(cls, a):
+        """Create from a 2-D dimarray.DimArray
+        """
+        if a.ndim != 2:
+            raise ValueError("expected 2-D array, got dimensions: {}".format(a.dims))
+        ydim, xdim = a.dims
+        return cls.from_dense(a.values, a.axes[xdim].values, a.axes[ydim].values, dims=a.dims, attrs=a.attrs)
+
+    @classmethod
+    def from_cells(cls, cells, values, x, y, dims=('y','x'), attrs=None):
+        """Create from sorted, flat cell indices (row-major) and their values
+        """
+        rows, starts, stops = _runs_from_cells(cells, np.size(x))
+        return cls(np.asarray(values), rows, starts, stops, x, y, dims=dims, attrs=attrs)
+
+    def cells(self):
+        """Flat indices (row-major) of the valid cells
+        """
+        lengths = self.stops - self.starts
+        return np.repeat(self.rows*self.x.size + self.starts - self.offsets, lengths) + np.arange(self.size)
+
+    def to_dense(self, fill_value=np.nan):
+        """Return the full 2-D numpy array, filled outside the valid cells
+        """
+        dtype = np.result_type(self.dtype, np.min_scalar_type(fill_value))
+        dense = np.empty(self.shape, dtype=dtype)
+        dense.fill(fill_value)
+        dense.flat[self.cells()] = self.values
+        return dense
+
+    def to_dimarray(self):
+        """Return the full 2-D dimarray.DimArray, with NaN outside the valid cells
+        """
+        a = da.DimArray(self.to_dense(), axes=[self.y, self.x], dims=self.dims)
+        a.attrs.update(self.attrs)
+        return a
+
+    def lookup(self, x, y):
+        """Values at the grid cells nearest to points x, y (NaN if invalid)
+        """
+        x, y = np.broadcast_arrays(x, y)
+        i = _nearest(self.y, y).ravel()
+        j = _nearest(self.x, x).ravel()
+        result = np.empty(i.size, dtype=np.result_type(self.dtype, np.float32))
+        result.fill(np.nan)
+        inside = (i >= 0) & (j >= 0)
+        i, j = i[inside], j[inside]
+        nx = self.x.size
+        k = np.searchsorted(self.rows*nx + self.starts, i*nx + j, side='right') - 1
+        found = k >= 0
+        found[found] = (self.rows[k[found]] == i[found]) & (j[found] < self.stops[k[found]])
+        values = result[inside]
+        values[found] = self.values[self.offsets[k[found]] + j[found] - self.starts[k[found]]]
+        result[inside] = values
+        return result.reshape(x.shape)
+
+    def same_layout(self, other):
+        """True if both grids have the same coordinates and valid cells
+        """
+        return (np.array_equal(self.rows, other.rows) and np.array_equal(self.starts, other.starts)
+                and np.array_equal(self.stops, other.stops) and self.same_grid(other))
+
+    def same_grid(self, other):
+        return np.array_equal(self.x, other.x) and np.array_equal(self.y, other.y)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        """Elementwise operations on valid cells (intersection for several grids)
+
+        Other keyword arguments (dtype...) are passed on to the ufunc. An
+        output grid (`out`, e.g. for in-place operators) must have the same
+        valid cells as the inputs.
+        """
+        if method != '__call__':
+            return NotImplemented
+        if ufunc.nout != 1:
+            raise ValueError("ufuncs with several outputs are not supported: "+ufunc.__name__)
+        out = kwargs.pop('out', None)
+        if out is not None:
+            out, = out
+            if not isinstance(out, CompactGrid):
+                return NotImplemented
+        # only scalars can be combined with the packed values
+        if any(not isinstance(a, CompactGrid) and np.ndim(a) != 0 for a in inputs):
+            return NotImplemented
+        grids = [a for a in inputs if isinstance(a, CompactGrid)]
+        first = grids[0]
+        for a in grids[1:]:
+            if not first.same_grid(a):
+                raise ValueError("grids do not match")
+
+        if all(first.same_layout(a) for a in grids[1:]):
+            args = [a.values if isinstance(a, CompactGrid) else a for a in inputs]
+            if out is not None:
+                if not out.same_layout(first):
+                    raise ValueError("output grid does not match")
+                ufunc(*args, out=out.values, **kwargs)
+                return out
+            result = ufunc(*args, **kwargs)
+            return CompactGrid(result, first.rows, first.starts, first.stops, first.x, first.y, dims=first.dims)
+
+        # different valid cells: only keep the intersection
+        if out is not None:
+            raise ValueError("output grid does not match")
+        cells = first.cells()
+        for a in grids[1:]:
+            cells = np.intersect1d(cells, a.cells(), assume_unique=True)
+        args = []
+        for a in inputs:
+            if isinstance(a, CompactGrid):
+                a = a.values[np.searchsorted(a.cells(), cells)]
+            args.append(a)
+        return CompactGrid.from_cells(cells, ufunc(*args, **kwargs), first.x, first.y, dims=first.dims)
+
+    def save(self, path):
+        """Write to a binary file that can be memory-mapped with CompactGrid.load
+        """
+        arrays = OrderedDict([('x', self.x), ('y', self.y), ('rows', self.rows),
+                              ('starts', self.starts), ('stops', self.stops), ('values', np.asarray(self.values))])
+        attrs = {k: v.tolist() if hasattr(v, 'tolist') else v for k, v in self.attrs.items()}
+        header = {'dims': list(self.dims), 'attrs': attrs, 'arrays': []}
+        offset = 0
+        for name, a in arrays.items():
+            header['arrays'].append({'name': name, 'dtype': a.dtype.str, 'shape': list(a.shape), 'offset': offset})
+            offset += -(-a.nbytes // _ALIGN) * _ALIGN
+        specs = header['arrays']
+        header = json.dumps(header).encode('utf-8')
+        start = -(-(len(_MAGIC) + 8 + len(header)) // _ALIGN) * _ALIGN
+
+        with open(path, 'wb') as f:
+            f.write(_MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            for spec, a in zip(specs, arrays.values()):
+                f.seek(start + spec['offset'])
+                f.write(np.ascontiguousarray(a).tobytes())
+            f.truncate(start + offset)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Read a file written by CompactGrid.save
+
+        mmap_mode : 'r', 'r+', 'c' (see numpy.memmap) or None to read in memory
+        """
+        with open(path, 'rb') as f:
+            if f.read(len(_MAGIC)) != _MAGIC:
+                raise ValueError("not a compact grid file: "+path)
+            n, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(n).decode('utf-8'))
+            start = -(-(len(_MAGIC) + 8 + n) // _ALIGN) * _ALIGN
+            arrays = {}
+            for spec in header['arrays']:
+                dtype = np.dtype(spec['dtype'])
+                shape = tuple(spec['shape'])
+                if mmap_mode is None or not np.prod(shape):
+                    f.seek(start + spec['offset'])
+                    arrays[spec['name']] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+                else:
+                    arrays[spec['name']] = np.memmap(path, dtype=dtype, mode=mmap_mode, offset=start + spec['offset'], shape=shape)
+        return cls(arrays['values'], arrays['rows'], arrays['starts'], arrays['stops'], arrays['x'], arrays['y'],
+                   dims=header['dims'], attrs=header['attrs'])
+
+
+class CompactDataset(OrderedDict):
+    """Dict of CompactGrid, with metadata as attributes
+    """
+    def to_dataset(self):
+        """Return the full dimarray.Dataset
+        """
+        ds = da.Dataset()
+        for k in self.keys():
+            ds[k] = self[k].to_dimarray()
+        ds.attrs.update({k: v for k, v in self.__dict__.items() if not k.startswith('_')})
+        return ds
+
+
+def to_compact(data):
+    """Convert a 2-D dimarray.DimArray or dimarray.Dataset to its compact form
+    """
+    if isinstance(data, da.Dataset):
+        compact = CompactDataset()
+        for k in data.keys():
+            compact[k] = CompactGrid.from_dimarray(data[k])
+        for k, v in data.attrs.items():
+            setattr(compact, k, v)
+        return compact
+    return CompactGrid.from_dimarray(data)
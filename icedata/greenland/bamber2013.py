@@ -2,8 +2,7 @@
 """
 import os
 import numpy as np
-import netCDF4 as nc
-from icedata.common import ncload as _ncload, get_datafile as _get_datafile, get_slices_xy
+from icedata.common import ncload as _ncload, get_datafile as _get_datafile, get_slices_xy, open_dataset, close_dataset
 
 #ncfile = datadir+'bamber_2013_1km/Greenland_bedrock_topography_V2.nc'
 NCFILE = os.path.join('greenland','bamber_2013_1km','Greenland_bedrock_topography_V3.nc')
@@ -31,8 +30,16 @@ VARIABLES = sorted(_MAP_VAR_NAMES.keys())
 RESOLUTION = 1000
 
 
-def load(variables=None, bbox=None, maxshape=None, processed=True):
+def load(variables=None, bbox=None, maxshape=None, processed=True, polygon=None, polygon_mapping=None, sparse=False, compact=False):
     """Load Bamber et al 2013 elevation dataset
+
+    Parameters
+    ----------
+    variables : variables to load
+    bbox: left, right, bottom, top (in local coordinate system)
+    maxshape: tuple, optional
+        maximum shape of the data to be loaded
+    polygon, polygon_mapping, sparse, compact : see icedata.common.ncload
     """
     map_var_names = _MAP_VAR_NAMES.copy()
     if not processed:
@@ -45,10 +52,11 @@ def load(variables=None, bbox=None, maxshape=None, processed=True):
 
     # need to read the variables independently
     ncfile = _get_datafile(NCFILE)
-    with nc.Dataset(ncfile) as ds:
-        x = ds.variables['projection_x_coordinate'][:]
-        y = ds.variables['projection_y_coordinate'][:]
+    ds = open_dataset(ncfile)
+    x = ds.variables['projection_x_coordinate'][:]
+    y = ds.variables['projection_y_coordinate'][:]
+    close_dataset(ds)
 
-    data = _ncload(NCFILE, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=map_var_names, x=x, y=y)
+    data = _ncload(NCFILE, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=map_var_names, x=x, y=y, polygon=polygon, polygon_mapping=polygon_mapping, grid_mapping=GRID_MAPPING, sparse=sparse, compact=compact)
     data.dataset = NAME 
     return data
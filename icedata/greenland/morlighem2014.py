@@ -26,14 +26,22 @@ _MAP_VAR_NAMES = {"surface_elevation":"surface",
 VARIABLES = sorted(_MAP_VAR_NAMES.keys())
 RESOLUTION = 150
 
-def load(variables=None, bbox=None, maxshape=None):
+def load(variables=None, bbox=None, maxshape=None, polygon=None, polygon_mapping=None, sparse=False, compact=False):
     """Load Bamber et al 2013 elevation dataset
+
+    Parameters
+    ----------
+    variables : variables to load
+    bbox: left, right, bottom, top (in local coordinate system)
+    maxshape: tuple, optional
+        maximum shape of the data to be loaded
+    polygon, polygon_mapping, sparse, compact : see icedata.common.ncload
     """
     # determine the variables to load
     if variables is None:
         variables = VARIABLES
 
-    # need to read the variables independently
-    data = _ncload(NCFILE, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=_MAP_VAR_NAMES, inverted_y_axis=True)
+    # the original NSIDC file has decreasing y, but also accept a pre-flipped file
+    data = _ncload(NCFILE, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=_MAP_VAR_NAMES, inverted_y_axis='auto', polygon=polygon, polygon_mapping=polygon_mapping, grid_mapping=GRID_MAPPING, sparse=sparse, compact=compact)
     data.dataset = NAME
     return data
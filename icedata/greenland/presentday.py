@@ -30,9 +30,17 @@ _map_dim_names = {"x":"x1","y":"y1"}
 def get_file(version=VERSION):
     return _get_datafile(_NCFILE.format(version=version))
 
-def load(variables=None, bbox=None, maxshape=None, version=VERSION):
+def load(variables=None, bbox=None, maxshape=None, version=VERSION, polygon=None, polygon_mapping=None, sparse=False, compact=False):
     """Load Present-day Greenland standard dataset
 
+    Parameters
+    ----------
+    variables : variables to load
+    bbox: left, right, bottom, top (in local coordinate system)
+    maxshape: tuple, optional
+        maximum shape of the data to be loaded
+    polygon, polygon_mapping, sparse, compact : see icedata.common.ncload
+
     Examples
     --------
     >>> from icedata.greenland import presentday as pdg
@@ -44,7 +52,7 @@ def load(variables=None, bbox=None, maxshape=None, version=VERSION):
     if variables is None:
         variables = VARIABLES
     ncname = _NCFILE.format(version=version)
-    data = _ncload(ncname, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=_map_var_names, map_dim_names=_map_dim_names, time_idx=0)
+    data = _ncload(ncname, variables=variables, bbox=bbox, maxshape=maxshape, map_var_names=_map_var_names, map_dim_names=_map_dim_names, time_idx=0, polygon=polygon, polygon_mapping=polygon_mapping, grid_mapping=GRID_MAPPING, sparse=sparse, compact=compact)
     data.dataset = NAME
     data.description = DESC
     return data
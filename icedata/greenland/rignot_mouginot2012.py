@@ -3,9 +3,9 @@
 
 import os
 import numpy as np
-import netCDF4 as nc
 import dimarray as da
-from icedata.common import get_datafile, get_slices_xy, check_variables
+from icedata.compact import to_compact
+from icedata.common import get_datafile, get_slices_xy, check_variables, polygon_bbox, check_polygon, read_polygon, open_dataset, close_dataset, forward_slice
 
 NAME = __name__
 DESC = __doc__
@@ -23,7 +23,7 @@ _MAP_VAR_NAMES = {"surface_velocity_x":"vx", "surface_velocity_y":"vy"}
 
 VARIABLES = sorted(_MAP_VAR_NAMES.keys()) + ["surface_velocity"]
 
-def load(variables=None, bbox=None, maxshape=None):
+def load(variables=None, bbox=None, maxshape=None, polygon=None, polygon_mapping=None, sparse=False, compact=False):
     """ load data for a region
     
     Parameters
@@ -32,6 +32,7 @@ def load(variables=None, bbox=None, maxshape=None):
     bbox: left, right, bottom, top (in local coordinate system)
     maxshape: tuple, optional
         maximum shape of the data to be loaded
+    polygon, polygon_mapping, sparse, compact : see icedata.common.ncload
 
     Returns
     -------
@@ -55,7 +56,13 @@ def load(variables=None, bbox=None, maxshape=None):
     else:
         surfvel = False
 
-    ds = _load(variables, bbox, maxshape)
+    polygon = check_polygon(polygon, polygon_mapping, GRID_MAPPING, sparse=sparse, compact=compact)
+
+    ds = _load(variables, bbox, maxshape, polygon=polygon, sparse=sparse)
+
+    # only keep valid cells
+    if compact:
+        ds = to_compact(ds)
 
     # now compute velocity magnitude
     if surfvel:
@@ -65,16 +72,16 @@ def load(variables=None, bbox=None, maxshape=None):
         for v in added_vars:
             del ds[v] # demove variable
 
-    if _variable:
+    if _variable and not (sparse and polygon is not None):
         ds = ds[_variable]
 
     return ds
 
 
-def _load(variables, bbox=None, maxshape=None):
+def _load(variables, bbox=None, maxshape=None, polygon=None, sparse=False):
     """
     """
-    f = nc.Dataset(get_datafile(NCFILE))
+    f = open_dataset(get_datafile(NCFILE))
 
     # reconstruct coordinates
     xmin, ymax = -638000.0, -657600.0
@@ -83,22 +90,37 @@ def _load(variables, bbox=None, maxshape=None):
     x = np.linspace (xmin, xmin + spacing*(nx-1), nx)  # ~ 10000 * 170000 points, 
     y = np.linspace (ymax, ymax - spacing*(ny-1), ny)  # reversed data
 
-    slice_x, slice_y = get_slices_xy((x,y), bbox, maxshape, inverted_y_axis=True)
+    if polygon is not None and bbox is None:
+        bbox = polygon_bbox(polygon)
 
-    vx = f.variables['vx'][slice_y, slice_x]
-    vy = f.variables['vy'][slice_y, slice_x]
-    x = x[slice_x]
-    y = y[slice_y]
+    slice_x, slice_y = get_slices_xy((x,y), bbox, maxshape, inverted_y_axis=True)
 
-    # convert all to a dataset
-    ds = da.Dataset()
     _map_var_names = _MAP_VAR_NAMES.copy()
-    for nm in variables:
-        ncvar = _map_var_names.pop(nm,nm)
-        ds[nm] = da.DimArray(f.variables[ncvar][slice_y, slice_x], axes=[y,x], dims=['y','x'])
-        # attributes
-        for att in f.variables[ncvar].ncattrs():
-            setattr(ds[nm], att.lower(), f.variables[ncvar].getncattr(att))
+    ncvariables = [_map_var_names.pop(nm,nm) for nm in variables]
+
+    if polygon is not None:
+        # only read the cells inside the polygon
+        ydim, xdim = f.variables[ncvariables[0]].dimensions
+        ds = read_polygon(f, ncvariables, x, y, slice_x, slice_y, polygon, ydim=ydim, xdim=xdim, sparse=sparse)
+        ds.rename_keys({ncvar:nm for nm, ncvar in zip(variables, ncvariables)}, inplace=True)
+        if not sparse:
+            ds.dims = ('y', 'x')
+        for nm in variables:
+            ds[nm].attrs = {att.lower():val for att, val in ds[nm].attrs.items()}
+
+    else:
+        # read forward, flip in memory
+        forward_y, _ = forward_slice(slice_y, y.size)
+        x = x[slice_x]
+        y = y[slice_y]
+
+        # convert all to a dataset
+        ds = da.Dataset()
+        for nm, ncvar in zip(variables, ncvariables):
+            ds[nm] = da.DimArray(f.variables[ncvar][forward_y, slice_x][::-1], axes=[y,x], dims=['y','x'])
+            # attributes
+            for att in f.variables[ncvar].ncattrs():
+                setattr(ds[nm], att.lower(), f.variables[ncvar].getncattr(att))
 
     # attributes
     for att in f.ncattrs():
@@ -107,6 +129,6 @@ def _load(variables, bbox=None, maxshape=None):
     ds.dataset = NCFILE
     ds.description = DESC
 
-    f.close()
+    close_dataset(f)
 
     return ds
@@ -0,0 +1,319 @@
+"""Local dataset server, sharing loaded variables between processes
+
+The server loads each requested variable once (full grid) and writes it to
+shared memory (a file under /dev/shm). Clients memory-map that file and
+return read-only DimArrays which are views on it, so that many processes on
+the same node do not each hold a copy of the same data.
+
+Protocol: one JSON request per line over a Unix socket, answered by one
+JSON line.
+
+    {"op": "load", "dataset": "greenland.bamber2013", "variable": "surface_elevation",
+     "options": {"processed": false}}
+    {"op": "stats"}
+
+Variables are cached by dataset, variable and options (extra keyword
+arguments of the dataset's load function, such as `version`).
+
+Examples
+--------
+Start the server (from the command line: icedata serve --memory 8000):
+
+>>> server = Server('/tmp/icedata.sock', budget=8e9)
+>>> server.serve_forever()
+
+And from each worker process:
+
+>>> from icedata.server import remote_load
+>>> load = remote_load('greenland.bamber2013')
+>>> z = load('surface_elevation', bbox=[-500e3, 0, -1500e3, -800e3])
+"""
+from __future__ import print_function, division
+import os
+import json
+import socket
+import tempfile
+import threading
+from collections import OrderedDict
+from importlib import import_module
+import numpy as np
+import dimarray as da
+from . import settings
+from .common import check_polygon, check_variables, get_slices_xy, polygon_bbox, polygon_runs, run_cells
+from .compact import to_compact
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver  # python 2
+
+def _default_shm_dir():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+
+def _jsonable(value):
+    return value.tolist() if hasattr(value, 'tolist') else value
+
+
+def _is_listening(socket_path):
+    """True if a server accepts connections on the Unix socket
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+    return True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+                response = self.server.process(request)
+            except Exception as error:
+                response = {'status': 'error', 'error': '{}: {}'.format(type(error).__name__, error)}
+            self.wfile.write((json.dumps(response)+'\n').encode('utf-8'))
+            self.wfile.flush()
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix-socket server holding variables in shared memory
+
+    Parameters
+    ----------
+    socket_path : path of the Unix socket (default to settings.SERVER_SOCKET)
+    budget : float, optional
+        memory budget in bytes: least-recently-used variables are evicted
+        beyond that (default: no limit)
+    shm_dir : directory for shared memory files (default to /dev/shm)
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path=None, budget=None, shm_dir=None):
+        if socket_path is None:
+            socket_path = settings.SERVER_SOCKET
+        self.socket_path = socket_path
+        self.budget = budget
+        self.shm_dir = shm_dir or _default_shm_dir()
+        self.cache = OrderedDict()  # (dataset, variable) : metadata, least recently used first
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()  # for cache bookkeeping only
+        self._io_lock = threading.Lock()  # netCDF reads, as netcdf-c is not thread-safe
+        self._loading = {}  # key : threading.Event, for variables being loaded
+        self._count = 0
+        if os.path.exists(socket_path):
+            if _is_listening(socket_path):
+                raise RuntimeError("a server is already running on "+socket_path)
+            os.remove(socket_path)  # stale socket
+        socketserver.UnixStreamServer.__init__(self, socket_path, _Handler)
+
+    def process(self, request):
+        """Answer one request (dict), return the response (dict)
+        """
+        op = request.get('op')
+        if op == 'load':
+            meta = self.get(request['dataset'], request['variable'], request.get('options'))
+            return dict(meta, status='ok')
+        elif op == 'stats':
+            with self._lock:
+                return dict(self.stats(), status='ok')
+        else:
+            raise ValueError("unknown operation: {}".format(op))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'nbytes': self.nbytes, 'budget': self.budget,
+                'variables': ['{}:{}{}'.format(dataset, variable, options if options != '{}' else '')
+                              for dataset, variable, options in self.cache]}
+
+    def get(self, dataset, variable, options=None):
+        """Metadata of a variable in shared memory, loaded if needed
+
+        Concurrent requests for a variable being loaded wait for that load.
+        Loads of different variables run one at a time (netCDF reads are not
+        thread-safe), but cache hits and stats are never blocked by a load.
+        """
+        options = options or {}
+        key = (dataset, variable, json.dumps(options, sort_keys=True))
+        while True:
+            with self._lock:
+                if key in self.cache:
+                    self.hits += 1
+                    meta = self.cache.pop(key)
+                    self.cache[key] = meta  # most recently used
+                    return meta
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    self._count += 1
+                    count = self._count
+                    break
+            loading.wait()  # then look up again (or load, if it failed)
+
+        try:
+            path = os.path.join(self.shm_dir, 'icedata-{}-{}.npy'.format(os.getpid(), count))
+            with self._io_lock:
+                a = import_module('icedata.'+dataset).load(variable, **options)
+                values = np.ma.filled(a.values, np.nan) if np.ma.isMaskedArray(a.values) else np.asarray(a.values)
+                np.save(path, values)
+            meta = {'path': path, 'nbytes': values.nbytes, 'dims': list(a.dims),
+                    'axes': [_jsonable(ax.values) for ax in a.axes],
+                    'attrs': {k: _jsonable(v) for k, v in a.attrs.items()}}
+            with self._lock:
+                self._evict(values.nbytes)
+                self.cache[key] = meta
+                self.nbytes += values.nbytes
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+        return meta
+
+    def _evict(self, nbytes):
+        """Remove least-recently-used variables to make room for nbytes
+
+        Clients that already mapped an evicted variable keep a valid view.
+        """
+        if self.budget is None:
+            return
+        while self.cache and self.nbytes + nbytes > self.budget:
+            _, meta = self.cache.popitem(last=False)
+            os.remove(meta['path'])
+            self.nbytes -= meta['nbytes']
+            self.evictions += 1
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        for meta in self.cache.values():
+            os.remove(meta['path'])
+        self.cache.clear()
+        self.nbytes = 0
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+class Client(object):
+    """Connection to a local Server
+
+    Parameters
+    ----------
+    socket_path : path of the Unix socket (default to settings.SERVER_SOCKET)
+    """
+    def __init__(self, socket_path=None):
+        if socket_path is None:
+            socket_path = settings.SERVER_SOCKET
+        self.socket_path = socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(socket_path)
+        self._file = self._sock.makefile('rwb')
+
+    def request(self, **request):
+        self._file.write((json.dumps(request)+'\n').encode('utf-8'))
+        self._file.flush()
+        response = json.loads(self._file.readline().decode('utf-8'))
+        if response.pop('status') != 'ok':
+            raise RuntimeError(response['error'])
+        return response
+
+    def stats(self):
+        """Server statistics: hits, misses, evictions, memory used...
+        """
+        return self.request(op='stats')
+
+    def get(self, dataset, variable, **options):
+        """Full variable as a read-only DimArray, view on shared memory
+
+        options : additional keyword arguments to the dataset's load function
+        """
+        for attempt in range(2):
+            meta = self.request(op='load', dataset=dataset, variable=variable, options=options)
+            try:
+                values = np.load(meta['path'], mmap_mode='r')
+                break
+            except (IOError, OSError):
+                if attempt:
+                    raise  # evicted in between
+        a = da.DimArray(values, axes=meta['axes'], dims=meta['dims'])
+        a.attrs.update(meta['attrs'])
+        return a
+
+    def load(self, dataset, variables=None, bbox=None, maxshape=None, polygon=None, polygon_mapping=None,
+             sparse=False, compact=False, **options):
+        """Same as the dataset's load function, with views on shared memory
+
+        The full variables are loaded by the server, then bbox, maxshape
+        (views) and polygon, sparse, compact (copies) are applied locally.
+
+        Parameters
+        ----------
+        dataset : dataset module name, e.g. "greenland.bamber2013"
+        variables, bbox, maxshape, polygon, polygon_mapping, sparse, compact : see the dataset's load function
+        **options : other keyword arguments to the dataset's load function (e.g. version)
+        """
+        mod = import_module('icedata.'+dataset)
+        if variables is None:
+            variables = mod.VARIABLES
+        variables, _variable = check_variables(variables)
+        polygon = check_polygon(polygon, polygon_mapping, mod.GRID_MAPPING, sparse=sparse, compact=compact)
+        if polygon is not None and bbox is None:
+            bbox = polygon_bbox(polygon)
+
+        data = da.Dataset()
+        for v in variables:
+            a = self.get(dataset, v, **options)
+            if a.dims != ('y', 'x'):
+                a = a.transpose('y', 'x')
+            x, y = a.axes['x'].values, a.axes['y'].values
+            slice_x, slice_y = get_slices_xy((x, y), bbox, maxshape, inverted_y_axis=y.size > 1 and y[0] > y[-1])
+            x, y = x[slice_x], y[slice_y]
+            values = a.values[slice_y, slice_x]
+
+            if polygon is None:
+                data[v] = da.DimArray(values, axes=[y, x], dims=['y', 'x'])
+            else:
+                rows, cols = run_cells(*polygon_runs(polygon, x, y))
+                if sparse:
+                    cells = rows*x.size + cols
+                    data['x'] = da.DimArray(x[cols], axes=[cells], dims=['cell'])
+                    data['y'] = da.DimArray(y[rows], axes=[cells], dims=['cell'])
+                    data[v] = da.DimArray(values[rows, cols], axes=[cells], dims=['cell'])
+                else:
+                    masked = np.empty(values.shape, dtype=np.promote_types(values.dtype, np.float32))
+                    masked.fill(np.nan)
+                    masked[rows, cols] = values[rows, cols]
+                    data[v] = da.DimArray(masked, axes=[y, x], dims=['y', 'x'])
+            data[v].attrs.update(a.attrs)
+        data.dataset = getattr(mod, 'NAME', dataset)
+
+        if compact:
+            data = to_compact(data)
+        if _variable is not None and not (sparse and polygon is not None):
+            data = data[_variable]
+        return data
+
+    def close(self):
+        self._file.close()
+        self._sock.close()
+
+
+def remote_load(dataset, socket_path=None):
+    """Drop-in replacement for a dataset's load function, served by a local Server
+
+    Examples
+    --------
+    >>> load = remote_load('greenland.morlighem2014')
+    >>> zb = load('bedrock_elevation', bbox=[-500e3, 0, -1500e3, -800e3])
+    """
+    client = Client(socket_path)
+    def load(variables=None, bbox=None, maxshape=None, **kwargs):
+        return client.load(dataset, variables, bbox=bbox, maxshape=maxshape, **kwargs)
+    load.__doc__ = import_module('icedata.'+dataset).load.__doc__
+    return load
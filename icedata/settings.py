@@ -1,2 +1,4 @@
+import tempfile
 from os import environ, path
 DATAROOT = path.join(environ['HOME'], 'icedata')
+SERVER_SOCKET = path.join(tempfile.gettempdir(), 'icedata.sock')
@@ -3,7 +3,10 @@
 """
 #from distutils.core import setup
 import os, sys, re
-from distutils.core import setup
+try:
+    from setuptools import setup
+except ImportError:
+    from distutils.core import setup
 import warnings
 
 with open('README.md') as file:
@@ -74,6 +77,7 @@ setup(name='icedata',
       keywords=('ice','greeland','gridded data'),
       # basic stuff here
       packages = ['icedata','icedata.greenland'],
+      entry_points = {'console_scripts': ['icedata = icedata.cli:main']},
       long_description=long_description,
       url='https://github.com/perrette/icedata',
       license = "MIT",
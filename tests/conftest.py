@@ -0,0 +1,61 @@
+"""Synthetic netCDF files for the tests
+"""
+import os
+import numpy as np
+import netCDF4 as nc
+import pytest
+from icedata import settings
+
+NX, NY = 60, 40
+SPACING = 10.
+
+def write_grid(ncfile, y, values, ydim='y', xdim='x', time=False):
+    """Write a (y, x) grid with coordinate metadata, and a fill value
+    """
+    with nc.Dataset(ncfile, 'w') as f:
+        if time:
+            f.createDimension('time', 1)
+            f.createVariable('time', 'f8', ('time',))[:] = [0]
+        f.createDimension(ydim, y.size)
+        f.createDimension(xdim, NX)
+        vx = f.createVariable(xdim, 'f8', (xdim,))
+        vx[:] = np.arange(NX)*SPACING
+        vx.units = 'm'
+        vy = f.createVariable(ydim, 'f8', (ydim,))
+        vy[:] = y
+        vy.units = 'm'
+        vy.standard_name = 'projection_y_coordinate'
+        dims = ('time', ydim, xdim) if time else (ydim, xdim)
+        for name, v in values.items():
+            var = f.createVariable(name, 'f4', dims, fill_value=-9999.)
+            var[:] = v[None] if time else v
+            var.units = 'm'
+        f.title = 'synthetic grid'
+
+@pytest.fixture
+def field():
+    z = np.arange(NY*NX, dtype='f4').reshape(NY, NX)
+    z[3, 5] = -9999.  # fill value
+    return z
+
+@pytest.fixture
+def grid_files(tmp_path, field):
+    """Same data, with increasing and decreasing y"""
+    y = np.arange(NY)*SPACING
+    asc = str(tmp_path / 'asc.nc')
+    desc = str(tmp_path / 'desc.nc')
+    write_grid(asc, y, {'z': field})
+    write_grid(desc, y[::-1], {'z': field[::-1]})
+    return asc, desc
+
+@pytest.fixture
+def dataroot(tmp_path, monkeypatch):
+    """Data root with a synthetic Present-day Greenland file"""
+    rng = np.random.RandomState(0)
+    ncdir = tmp_path / 'greenland' / 'Present_Day_Greenland'
+    ncdir.mkdir(parents=True)
+    values = {v: rng.rand(NY, NX).astype('f4') for v in ['usrf', 'topg', 'thk', 'surfvelmag', 'dhdt']}
+    values['thk'][values['thk'] < 0.3] = -9999.
+    write_grid(str(ncdir / 'Greenland_5km_v1.1.nc'), np.arange(NY)*SPACING, values, ydim='y1', xdim='x1', time=True)
+    monkeypatch.setattr(settings, 'DATAROOT', str(tmp_path))
+    return str(tmp_path)
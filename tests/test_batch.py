@@ -0,0 +1,93 @@
+import json
+import numpy as np
+import pytest
+import dimarray as da
+from icedata import batch, cli
+from icedata.greenland import presentday
+
+def write_jobs(path, jobs):
+    jobfile = str(path / 'jobs.json')
+    with open(jobfile, 'w') as f:
+        json.dump(jobs, f)
+    return jobfile
+
+@pytest.fixture
+def jobs(dataroot, tmp_path):
+    return [
+        {'dataset': 'greenland.presentday', 'variables': 'ice_thickness',
+         'bbox': [50, 400, 35, 300], 'output': str(tmp_path / 'thk.nc')},
+        {'dataset': 'greenland.presentday', 'variables': ['surface_elevation', 'bedrock_elevation'],
+         'maxshape': [7, 9], 'output': str(tmp_path / 'zs_zb.nc')},
+        {'dataset': 'greenland.presentday', 'variables': 'surface_velocity',
+         'options': {'polygon': [(101.3, 13.7), (503.1, 37.2), (404.4, 352.9)], 'compact': True},
+         'output': str(tmp_path / 'vel.nc')},
+    ]
+
+def test_read_jobs(tmp_path):
+    jobs = batch.read_jobs(write_jobs(tmp_path, [{'dataset': 'a', 'output': 'a.nc'},
+                                                 {'dataset': 'b', 'output': 'b.nc', 'id': 'b'}]))
+    assert [job['id'] for job in jobs] == [0, 'b']
+    with pytest.raises(ValueError, match='job 1'):
+        batch.read_jobs(write_jobs(tmp_path, [{'dataset': 'a', 'output': 'a.nc'}, {'dataset': 'b'}]))
+
+def test_chunk_jobs():
+    jobs = [{'id': i, 'dataset': name, 'output': ''} for i, name in enumerate('abaabc')]
+    chunks = batch.chunk_jobs(jobs, 2)
+    assert [[job['id'] for job in chunk] for chunk in chunks] == [[0, 2], [3], [1], [4], [5]]
+
+def test_run_job(jobs):
+    for i, job in enumerate(jobs):
+        job['id'] = i
+        result = batch.run_job(job)
+        assert result['status'] == 'ok', result['error']
+        assert result['nbytes'] > 0
+
+    thk = da.read_nc(jobs[0]['output'], 'ice_thickness')
+    expected = presentday.load('ice_thickness', bbox=jobs[0]['bbox'])
+    assert np.array_equal(thk.values, expected.values, equal_nan=True)
+    assert np.array_equal(thk.x, expected.x) and np.array_equal(thk.y, expected.y)
+
+    ds = da.read_nc(jobs[1]['output'])
+    expected = presentday.load(jobs[1]['variables'], maxshape=(7, 9))
+    for v in jobs[1]['variables']:
+        assert np.array_equal(ds[v].values, expected[v].values, equal_nan=True)
+
+    vel = da.read_nc(jobs[2]['output'], 'surface_velocity')
+    expected = presentday.load('surface_velocity', polygon=jobs[2]['options']['polygon'])
+    assert np.array_equal(vel.values, expected.values, equal_nan=True)
+
+def test_run_job_error(dataroot, tmp_path):
+    result = batch.run_job({'id': 0, 'dataset': 'greenland.nonexistent', 'output': str(tmp_path / 'a.nc')})
+    assert result['status'] == 'failed'
+    assert 'ImportError' in result['error'] or 'ModuleNotFoundError' in result['error']
+
+def test_run_batch_retry(jobs, tmp_path, monkeypatch, capsys):
+    # the second job fails on its first attempt (workers are forked, so
+    # attempts are counted in files)
+    run_job = batch.run_job
+    def flaky_run_job(job):
+        with open(str(tmp_path / 'attempts-{}'.format(job['id'])), 'a') as f:
+            f.write('.')
+        if job['id'] == 1 and not (tmp_path / 'failed').exists():
+            (tmp_path / 'failed').touch()
+            return {'id': job['id'], 'output': job['output'], 'nbytes': 0, 'error': 'flaky',
+                    'status': 'failed', 'elapsed': 0.}
+        return run_job(job)
+    monkeypatch.setattr(batch, 'run_job', flaky_run_job)
+
+    jobs = batch.read_jobs(write_jobs(tmp_path, jobs))
+    results = batch.run_batch(jobs, processes=2)
+    assert [r['status'] for r in results] == ['ok']*3
+    assert sorted(r['id'] for r in results) == [0, 1, 2]
+    attempts = [(tmp_path / 'attempts-{}'.format(i)).read_text() for i in range(3)]
+    assert attempts == ['.', '..', '.']
+    assert 'retry 1 failed job(s)' in capsys.readouterr().out
+
+def test_cli_batch(jobs, dataroot, tmp_path):
+    jobfile = write_jobs(tmp_path, jobs[:1])
+    assert cli.main(['--dataroot', dataroot, 'batch', jobfile, '-j', '1']) == 0
+    assert da.read_nc(jobs[0]['output'], 'ice_thickness').size > 0
+
+    bad = dict(jobs[0], dataset='greenland.nonexistent')
+    jobfile = write_jobs(tmp_path, [jobs[0], bad])
+    assert cli.main(['--dataroot', dataroot, 'batch', jobfile, '-j', '1', '--retries', '0']) == 1
@@ -0,0 +1,119 @@
+import pickle
+import numpy as np
+import pytest
+from icedata.compact import CompactGrid, CompactDataset
+from icedata.common import ncload
+
+@pytest.fixture
+def grids():
+    rng = np.random.RandomState(0)
+    x = np.arange(70)*10.
+    y = np.arange(50)[::-1]*10.
+    a = rng.randn(50, 70)
+    a[a < 0.3] = np.nan
+    b = rng.randn(50, 70)
+    b[b < 0] = np.nan
+    return x, y, a, b
+
+def test_dense_roundtrip(grids):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y)
+    assert c.size == np.isfinite(a).sum()
+    assert np.array_equal(c.to_dense(), a, equal_nan=True)
+    assert np.array_equal(c.to_dimarray().values, a, equal_nan=True)
+    assert np.array_equal(np.sort(c.cells()), np.flatnonzero(np.isfinite(a)))
+
+def test_arithmetic(grids):
+    x, y, a, b = grids
+    ca = CompactGrid.from_dense(a, x, y)
+    cb = CompactGrid.from_dense(b, x, y)
+    # same layout
+    assert np.array_equal((ca*2 + 1).to_dense(), a*2 + 1, equal_nan=True)
+    # different layouts: intersection of valid cells
+    speed = np.sqrt(np.square(ca) + np.square(cb))
+    assert np.array_equal(speed.to_dense(), np.sqrt(a**2 + b**2), equal_nan=True)
+
+def test_arithmetic_array_operand(grids):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y)
+    with pytest.raises(TypeError):
+        c + a
+
+def test_arithmetic_inplace(grids):
+    x, y, a, b = grids
+    c = CompactGrid.from_dense(a, x, y)
+    values = c.values
+    c += 1
+    c *= c
+    assert c.values is values
+    assert np.array_equal(c.to_dense(), (a + 1)**2, equal_nan=True)
+    np.add(c, 1, out=c)
+    assert np.array_equal(c.to_dense(), (a + 1)**2 + 1, equal_nan=True)
+    # output grid with different valid cells
+    cb = CompactGrid.from_dense(b, x, y)
+    with pytest.raises(ValueError):
+        c += cb
+    with pytest.raises(ValueError):
+        np.add(c, 1, out=cb)
+
+def test_arithmetic_kwargs(grids):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y)
+    d = np.add(c, 1, dtype='f4')
+    assert d.dtype == np.float32
+    assert np.array_equal(d.to_dense(), np.add(a, 1, dtype='f4'), equal_nan=True)
+
+@pytest.mark.parametrize('func', [np.modf, np.divmod])
+def test_arithmetic_several_outputs(grids, func):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y)
+    with pytest.raises(ValueError):
+        func(*[c]*func.nin)
+
+def test_lookup(grids):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y)
+    rng = np.random.RandomState(1)
+    xi = rng.uniform(-20, 720, 1000)
+    yi = rng.uniform(-20, 520, 1000)
+    j = np.round(xi/10).astype(int)
+    i = 49 - np.round(yi/10).astype(int)
+    ok = (xi >= -5) & (xi <= 695) & (yi >= -5) & (yi <= 495)
+    expected = np.full(xi.size, np.nan)
+    expected[ok] = a[i[ok], j[ok]]
+    assert np.array_equal(c.lookup(xi, yi), expected, equal_nan=True)
+    assert c.lookup(xi[:10].reshape(2, 5), yi[0]).shape == (2, 5)
+
+def test_save_load(grids, tmp_path):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y, attrs={'units': 'm/yr'})
+    path = str(tmp_path / 'c.cmp')
+    c.save(path)
+    c2 = CompactGrid.load(path)
+    assert isinstance(c2.values, np.memmap)
+    assert c2.units == 'm/yr'
+    assert np.array_equal(c2.to_dense(), a, equal_nan=True)
+    c3 = CompactGrid.load(path, mmap_mode=None)
+    assert not isinstance(c3.values, np.memmap)
+    assert np.array_equal(c3.to_dense(), a, equal_nan=True)
+
+def test_empty(tmp_path):
+    c = CompactGrid.from_dense(np.full((3, 3), np.nan), np.arange(3.), np.arange(3.))
+    path = str(tmp_path / 'e.cmp')
+    c.save(path)
+    assert CompactGrid.load(path).size == 0
+
+def test_pickle(grids):
+    x, y, a, _ = grids
+    c = CompactGrid.from_dense(a, x, y, attrs={'units': 'm/yr'})
+    c2 = pickle.loads(pickle.dumps(c))
+    assert c2.units == 'm/yr'
+    assert np.array_equal(c2.to_dense(), a, equal_nan=True)
+
+def test_ncload_compact(grid_files, field):
+    asc, _ = grid_files
+    data = ncload(asc, ['z'], compact=True, dataroot='/')
+    assert isinstance(data, CompactDataset)
+    expected = np.where(field == -9999., np.nan, field)
+    assert np.array_equal(data['z'].to_dense(), expected, equal_nan=True)
+    assert data['z'].units == 'm'
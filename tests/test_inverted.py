@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from icedata.common import ncload, forward_slice, get_slices_xy
+
+@pytest.mark.parametrize('s', [slice(None, None, -1), slice(19, None, -3), slice(17, 2, -2),
+                               slice(5, 5, -1), slice(None, None, 2), slice(3, 40, 4)])
+def test_forward_slice(s):
+    a = np.arange(20)
+    forward, flip = forward_slice(s, a.size)
+    assert forward.step > 0
+    assert np.array_equal(a[forward][::-1] if flip else a[forward], a[s])
+
+@pytest.mark.parametrize('bbox', [None, (0, 40, 15, 120), (0, 40, 0, 190), (0, 40, 0, 195)])
+@pytest.mark.parametrize('maxshape', [None, (3, 3), (7, 2)])
+def test_inverted_slices(bbox, maxshape):
+    """Same selection as with increasing y"""
+    x = np.arange(5.)*10
+    y = np.arange(20.)*10
+    slice_x, slice_y = get_slices_xy((x, y), bbox, maxshape, False)
+    slice_x2, slice_y2 = get_slices_xy((x, y[::-1]), bbox, maxshape, True)
+    assert slice_x == slice_x2
+    assert np.array_equal(y[slice_y], y[::-1][slice_y2])
+
+@pytest.mark.parametrize('kwargs', [{}, {'bbox': (50, 400, 35, 300)}, {'maxshape': (7, 9)},
+                                    {'bbox': (50, 400, 35, 300), 'maxshape': (7, 9)},
+                                    {'polygon': [(101.3, 13.7), (503.1, 37.2), (404.4, 352.9)]}])
+def test_ncload_inverted(grid_files, kwargs):
+    asc, desc = grid_files
+    a = ncload(asc, ['z'], dataroot='/', **kwargs)
+    b = ncload(desc, ['z'], dataroot='/', inverted_y_axis='auto', **kwargs)
+    c = ncload(asc, ['z'], dataroot='/', inverted_y_axis='auto', **kwargs)
+    for d in [b, c]:
+        assert np.array_equal(a['z'].values, d['z'].values, equal_nan=True)
+        assert np.array_equal(a['z'].y, d['z'].y)
+
+def test_ncload_inverted_metadata(grid_files):
+    _, desc = grid_files
+    data = ncload(desc, 'z', dataroot='/', inverted_y_axis='auto')
+    assert data.axes['y'].attrs['units'] == 'm'
+    assert data.axes['y'].attrs['standard_name'] == 'projection_y_coordinate'
+    assert data.axes['x'].attrs['units'] == 'm'
+    assert data.units == 'm'
@@ -0,0 +1,111 @@
+import numpy as np
+import netCDF4 as nc
+import dimarray as da
+import pytest
+from icedata.common import ncload, check_polygon, polygon_runs, group_runs, run_cells, polygon_bbox, get_slices_xy
+
+POLYGON = [(101.3, 13.7), (503.1, 37.2), (404.4, 352.9), (23.3, 301.1), (201.7, 203.3)]
+
+def inside(polygon, x, y):
+    """Brute-force even-odd test at every grid point"""
+    X, Y = np.meshgrid(x, y)
+    result = np.zeros(X.shape, dtype=bool)
+    px, py = np.asarray(polygon).T
+    for x0, y0, x1, y1 in zip(px, py, np.roll(px, -1), np.roll(py, -1)):
+        crosses = (np.minimum(y0, y1) <= Y) & (Y < np.maximum(y0, y1))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xc = x0 + (Y - y0) / (y1 - y0) * (x1 - x0)
+        result ^= crosses & (X < xc)
+    return result
+
+def runs_mask(runs, shape):
+    mask = np.zeros(shape, dtype=bool)
+    mask[run_cells(*runs)] = True
+    return mask
+
+def test_polygon_runs():
+    x = np.arange(60)*10.
+    y = np.arange(40)*10.
+    runs = polygon_runs(POLYGON, x, y)
+    assert np.array_equal(runs_mask(runs, (40, 60)), inside(POLYGON, x, y))
+    # sorted by row, then start
+    rows, starts, _ = runs
+    assert np.all(np.diff(rows*60 + starts) > 0)
+
+def test_polygon_runs_decreasing_y():
+    x = np.arange(60)*10.
+    y = np.arange(40)[::-1]*10.
+    runs = polygon_runs(POLYGON, x, y)
+    assert np.array_equal(runs_mask(runs, (40, 60)), inside(POLYGON, x, y))
+
+def test_group_runs():
+    x = np.arange(300)*10.
+    y = np.arange(200)*10.
+    thin = [(10.5, 10.5), (30.5, 10.5), (2990.5, 1980.5), (2970.5, 1980.5)]
+    rows, starts, stops = polygon_runs(thin, x, y)
+    blocks = group_runs(rows, starts, stops, overhead=64)
+    assert len(blocks) > 1
+    area = sum((r1-r0)*(c1-c0) for (r0, r1, c0, c1), _ in blocks)
+    assert area < 0.1 * x.size * y.size  # much less than the bounding box
+
+    # each cell exactly once, inside its block, with packed offsets
+    packed = np.zeros((stops - starts).sum(), dtype=int)
+    mask = np.zeros((200, 300), dtype=int)
+    for (r0, r1, c0, c1), (brows, bstarts, bstops, offsets) in blocks:
+        assert np.all((brows >= r0) & (brows < r1) & (bstarts >= c0) & (bstops <= c1))
+        for row, start, stop, offset in zip(brows, bstarts, bstops, offsets):
+            mask[row, start:stop] += 1
+            packed[offset:offset+stop-start] = row*300 + np.arange(start, stop)
+    assert np.array_equal(mask, runs_mask((rows, starts, stops), (200, 300)))
+    assert np.array_equal(packed, np.flatnonzero(mask))
+
+def test_ncload_polygon(grid_files, field):
+    asc, _ = grid_files
+    data = ncload(asc, 'z', polygon=POLYGON, dataroot='/')
+    x = np.arange(60)*10.
+    y = np.arange(40)*10.
+    slice_x, slice_y = get_slices_xy((x, y), polygon_bbox(POLYGON), None, False)
+    mask = inside(POLYGON, x, y)[slice_y, slice_x]
+    expected = np.where(mask, field[slice_y, slice_x], np.nan)
+    expected[expected == -9999.] = np.nan
+    assert np.array_equal(data.values, expected, equal_nan=True)
+    assert data.units == 'm'
+
+def test_ncload_polygon_sparse(grid_files, field):
+    asc, _ = grid_files
+    data = ncload(asc, 'z', polygon=POLYGON, sparse=True, dataroot='/')
+    assert isinstance(data, da.Dataset)
+    assert set(data.keys()) == {'x', 'y', 'z'}
+    i = (data['y'].values / 10).astype(int)
+    j = (data['x'].values / 10).astype(int)
+    expected = np.where(field[i, j] == -9999., np.nan, field[i, j])
+    assert np.array_equal(data['z'].values, expected, equal_nan=True)
+    assert data['z'].size == inside(POLYGON, np.arange(60)*10., np.arange(40)*10.).sum()
+
+def test_ncload_polygon_maxshape(grid_files):
+    asc, _ = grid_files
+    full = ncload(asc, 'z', dataroot='/', maxshape=(10, 10))
+    data = ncload(asc, 'z', polygon=[(-1, -1), (1000, -1), (1000, 1000), (-1, 1000)], dataroot='/', maxshape=(10, 10))
+    assert np.array_equal(data.values, full.values, equal_nan=True)
+
+def test_ncload_polygon_packed(grid_files, field):
+    asc, _ = grid_files
+    with nc.Dataset(asc, 'a') as f:
+        v = f.createVariable('zp', 'i2', ('y', 'x'), fill_value=-32767)
+        v.scale_factor = 0.5
+        v.add_offset = 100.
+        v[:] = np.ma.masked_equal(field, -9999.) % 1000
+    full = ncload(asc, 'zp', bbox=polygon_bbox(POLYGON), dataroot='/')
+    data = ncload(asc, 'zp', polygon=POLYGON, dataroot='/')
+    assert data.dtype == full.dtype == np.float64
+    mask = np.isfinite(data.values)
+    assert np.array_equal(data.values[mask], np.ma.filled(full.values, np.nan)[mask])
+    assert {k: data.attrs[k] for k in full.attrs} == dict(full.attrs)
+
+def test_check_polygon(grid_files):
+    assert check_polygon(POLYGON) is POLYGON
+    assert check_polygon(None, {'grid_mapping_name': 'latitude_longitude'}) is None
+    with pytest.raises(ValueError):
+        check_polygon(POLYGON, sparse=True, compact=True)
+    with pytest.raises(ValueError):
+        ncload(grid_files[0], 'z', polygon=POLYGON, sparse=True, compact=True, dataroot='/')
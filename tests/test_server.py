@@ -0,0 +1,140 @@
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import numpy as np
+import pytest
+from icedata.greenland import presentday
+from icedata.compact import CompactGrid
+from icedata.server import Server, Client, remote_load
+
+POLYGON = [(101.3, 13.7), (503.1, 37.2), (404.4, 352.9), (23.3, 301.1)]
+
+@pytest.fixture
+def tmpdir_short():
+    # Unix socket paths are limited to about 100 characters
+    path = tempfile.mkdtemp(prefix='icd')
+    yield path
+    shutil.rmtree(path)
+
+@pytest.fixture
+def server(dataroot, tmpdir_short):
+    server = Server(os.path.join(tmpdir_short, 's.sock'), shm_dir=tmpdir_short)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.parametrize('kwargs', [{}, {'bbox': [50, 400, 35, 300]}, {'maxshape': (7, 9)},
+                                    {'polygon': POLYGON}, {'version': 'v1.1'}])
+def test_load(server, kwargs):
+    load = remote_load('greenland.presentday', server.socket_path)
+    a = load('ice_thickness', **kwargs)
+    b = presentday.load('ice_thickness', **kwargs)
+    assert np.array_equal(a.values, b.values, equal_nan=True)
+    assert np.array_equal(a.x, b.x) and np.array_equal(a.y, b.y)
+    assert a.units == 'm'
+
+def test_load_views(server):
+    a = Client(server.socket_path).load('greenland.presentday', 'surface_elevation', bbox=[50, 400, 35, 300])
+    assert not a.values.flags.writeable
+    assert not a.values.flags.owndata
+
+def test_load_sparse_compact(server):
+    client = Client(server.socket_path)
+    a = client.load('greenland.presentday', 'ice_thickness', polygon=POLYGON, sparse=True)
+    b = presentday.load('ice_thickness', polygon=POLYGON, sparse=True)
+    for v in ['x', 'y', 'ice_thickness']:
+        assert np.array_equal(a[v].values, b[v].values, equal_nan=True)
+    c = client.load('greenland.presentday', 'ice_thickness', compact=True)
+    assert isinstance(c, CompactGrid)
+    assert np.array_equal(c.to_dense(), presentday.load('ice_thickness').values, equal_nan=True)
+
+def test_stats_eviction(dataroot, tmpdir_short):
+    server = Server(os.path.join(tmpdir_short, 's.sock'), budget=2.5*40*60*4, shm_dir=tmpdir_short)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        client = Client(server.socket_path)
+        first = client.load('greenland.presentday', 'surface_elevation')
+        client.load('greenland.presentday', ['surface_elevation', 'ice_thickness', 'bedrock_elevation'])
+        stats = client.stats()
+        assert (stats['hits'], stats['misses'], stats['evictions']) == (1, 3, 1)
+        assert stats['variables'] == ['greenland.presentday:ice_thickness', 'greenland.presentday:bedrock_elevation']
+        assert len([f for f in os.listdir(tmpdir_short) if f.endswith('.npy')]) == 2
+        assert np.isfinite(first.values).all()  # evicted, but still mapped
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert os.listdir(tmpdir_short) == []
+
+def test_error(server):
+    with pytest.raises(RuntimeError):
+        Client(server.socket_path).load('greenland.presentday', 'nope')
+
+def test_slow_load_does_not_block(server, monkeypatch):
+    load = presentday.load
+    def slow_load(*args, **kwargs):
+        time.sleep(1)
+        return load(*args, **kwargs)
+    monkeypatch.setattr(presentday, 'load', slow_load)
+
+    get = lambda: Client(server.socket_path).get('greenland.presentday', 'ice_thickness')
+    threads = [threading.Thread(target=get) for _ in range(2)]
+    for t in threads:
+        t.start()
+    time.sleep(0.2)
+    start = time.time()
+    Client(server.socket_path).stats()
+    assert time.time() - start < 0.5
+    for t in threads:
+        t.join()
+    stats = Client(server.socket_path).stats()
+    assert stats['misses'] == 1  # loaded once
+
+def test_socket_in_use(server):
+    with pytest.raises(RuntimeError):
+        Server(server.socket_path)
+    assert Client(server.socket_path).stats()['misses'] == 0
+
+def test_stale_socket(dataroot, tmpdir_short):
+    path = os.path.join(tmpdir_short, 's.sock')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.close()
+    server = Server(path, shm_dir=tmpdir_short)
+    server.server_close()
+
+def test_concurrent_loads(server, monkeypatch):
+    """Loads of different variables do not read netCDF files concurrently"""
+    load = presentday.load
+    active = []
+    overlaps = []
+    def tracking_load(*args, **kwargs):
+        active.append(1)
+        overlaps.append(len(active))
+        time.sleep(0.2)
+        try:
+            return load(*args, **kwargs)
+        finally:
+            active.pop()
+    monkeypatch.setattr(presentday, 'load', tracking_load)
+
+    variables = ['ice_thickness', 'surface_elevation', 'bedrock_elevation']
+    results = {}
+    def get(v):
+        results[v] = Client(server.socket_path).get('greenland.presentday', v)
+    threads = [threading.Thread(target=get, args=(v,)) for v in variables]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert max(overlaps) == 1
+    for v in variables:
+        assert np.array_equal(results[v].values, load(v).values, equal_nan=True)
+    assert Client(server.socket_path).stats()['misses'] == 3